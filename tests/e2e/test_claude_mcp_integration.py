@@ -9,11 +9,30 @@ import os
 import subprocess
 import sys
 import tempfile
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 import pytest
 
+# (name, prompt, check) - check receives Claude's lowercased stdout
+CASES = [
+    (
+        "SAGE tool invocation",
+        "Use the sage tool to calculate 2+2",
+        lambda out: "4" in out or "four" in out,
+    ),
+    (
+        "list_models tool",
+        "Use the list_models tool to show available AI models",
+        lambda out: any(provider in out for provider in ["gemini", "openai", "anthropic", "gpt", "claude"]),
+    ),
+    (
+        "SAGE tool with mode parameter",
+        "Use the sage tool with mode 'analyze' to explain what a Python decorator is",
+        lambda out: "decorator" in out or "function" in out,
+    ),
+]
+
 
 class TestClaudeMCPIntegration:
     """Test real Claude CLI with MCP server"""
@@ -41,13 +60,9 @@ class TestClaudeMCPIntegration:
         if cls.config_file.exists():
             cls.config_file.unlink()
 
-    def test_mcp_server_connection(self):
-        """Test that Claude can connect to our MCP server"""
-        if not os.path.exists(self.claude_binary):
-            pytest.skip("Claude binary not found at /usr/bin/claude")
-
-        # Test with a simple echo to check connection
-        result = subprocess.run(
+    def _run_claude(self, prompt):
+        """Run one non-interactive Claude prompt against the SAGE MCP server"""
+        return subprocess.run(
             [
                 self.claude_binary,
                 "--strict-mcp-config",
@@ -55,13 +70,21 @@ class TestClaudeMCPIntegration:
                 str(self.config_file),
                 "--dangerously-skip-permissions",
                 "-p",
-                "List available tools",
+                prompt,
             ],
             capture_output=True,
             text=True,
             timeout=30,
         )
 
+    def test_mcp_server_connection(self):
+        """Test that Claude can connect to our MCP server"""
+        if not os.path.exists(self.claude_binary):
+            pytest.skip("Claude binary not found at /usr/bin/claude")
+
+        # Test with a simple echo to check connection
+        result = self._run_claude("List available tools")
+
         # Check that sage tools are mentioned
         output = result.stdout + result.stderr
         assert (
@@ -70,87 +93,19 @@ class TestClaudeMCPIntegration:
 
         print("✓ Claude connected to SAGE MCP server")
 
-    def test_sage_tool_invocation(self):
-        """Test that Claude can invoke the sage tool"""
+    def test_claude_mcp_batch(self):
+        """Test sage/list_models tool prompts, running the Claude processes concurrently"""
         if not os.path.exists(self.claude_binary):
             pytest.skip("Claude binary not found")
 
-        # Test invoking the sage tool
-        result = subprocess.run(
-            [
-                self.claude_binary,
-                "--strict-mcp-config",
-                "--mcp-config",
-                str(self.config_file),
-                "--dangerously-skip-permissions",
-                "-p",
-                "Use the sage tool to calculate 2+2",
-            ],
-            capture_output=True,
-            text=True,
-            timeout=30,
-        )
-
-        output = result.stdout.lower()
-        assert "4" in output or "four" in output, f"Expected answer to 2+2, got: {result.stdout}"
-
-        print("✓ Claude successfully invoked SAGE tool")
-
-    def test_list_models_tool(self):
-        """Test the list_models MCP tool"""
-        if not os.path.exists(self.claude_binary):
-            pytest.skip("Claude binary not found")
-
-        result = subprocess.run(
-            [
-                self.claude_binary,
-                "--strict-mcp-config",
-                "--mcp-config",
-                str(self.config_file),
-                "--dangerously-skip-permissions",
-                "-p",
-                "Use the list_models tool to show available AI models",
-            ],
-            capture_output=True,
-            text=True,
-            timeout=30,
-        )
-
-        output = result.stdout
-        # Check for provider names or model indicators
-        assert any(
-            provider in output.lower() for provider in ["gemini", "openai", "anthropic", "gpt", "claude"]
-        ), f"No model providers found in output: {output}"
-
-        print("✓ list_models tool working")
-
-    def test_sage_with_mode(self):
-        """Test sage tool with different modes"""
-        if not os.path.exists(self.claude_binary):
-            pytest.skip("Claude binary not found")
-
-        # Test with analyze mode
-        result = subprocess.run(
-            [
-                self.claude_binary,
-                "--strict-mcp-config",
-                "--mcp-config",
-                str(self.config_file),
-                "--dangerously-skip-permissions",
-                "-p",
-                "Use the sage tool with mode 'analyze' to explain what a Python decorator is",
-            ],
-            capture_output=True,
-            text=True,
-            timeout=30,
-        )
-
-        output = result.stdout
-        assert (
-            "decorator" in output.lower() or "function" in output.lower()
-        ), f"Expected explanation of decorators, got: {output}"
-
-        print("✓ SAGE tool with mode parameter working")
+        # Each worker thread just blocks on its own subprocess
+        with ThreadPoolExecutor(max_workers=min(5, len(CASES))) as ex:
+            futs = {ex.submit(self._run_claude, prompt): (name, check) for name, prompt, check in CASES}
+            for fut in as_completed(futs):
+                name, check = futs[fut]
+                output = fut.result().stdout
+                assert check(output.lower()), f"{name}: {output}"
+                print(f"✓ {name} working")
 
     def test_mcp_error_handling(self):
         """Test MCP server error handling"""
@@ -158,20 +113,7 @@ class TestClaudeMCPIntegration:
             pytest.skip("Claude binary not found")
 
         # Test with invalid tool call
-        result = subprocess.run(
-            [
-                self.claude_binary,
-                "--strict-mcp-config",
-                "--mcp-config",
-                str(self.config_file),
-                "--dangerously-skip-permissions",
-                "-p",
-                "Use a tool called 'nonexistent_tool' to do something",
-            ],
-            capture_output=True,
-            text=True,
-            timeout=30,
-        )
+        result = self._run_claude("Use a tool called 'nonexistent_tool' to do something")
 
         # Should gracefully handle or mention tool doesn't exist
         assert (
@@ -4,10 +4,11 @@ Folder Content Testing Script
 Tests folder traversal, file filtering, and directory structure handling
 """
 
-import asyncio
+import io
 import json
 import os
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import pytest
@@ -19,8 +20,29 @@ sys.path.append(str(Path(__file__).parent.parent.parent))
 
 from tools.sage import SageTool
 from utils.files import expand_paths, read_files
+from utils.tokens import estimate_tokens_for_files
 from config import Config
 
+_CFG = Config()
+_EXCLUDED_DIRS = frozenset(_CFG.EXCLUDED_DIRS)
+_ALLOWED_EXT = frozenset(_CFG.ALLOWED_FILE_EXTENSIONS)
+
+
+def _iter_files(root: str, skip: frozenset = frozenset()):
+    """Yield (path, size) for every file under root, reusing each DirEntry's stat
+
+    Directories named in skip are pruned without being scanned.
+    """
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in skip:
+                        stack.append(entry.path)
+                else:
+                    yield entry.path, entry.stat().st_size
+
 
 class TestFolderContent:
     """Test folder content processing and filtering"""
@@ -28,9 +50,16 @@ class TestFolderContent:
     @classmethod
     def setup_class(cls):
         """Setup test project structure"""
-        cls.temp_dir = tempfile.mkdtemp()
+        # Resolved, so it is a literal prefix of the (resolved) paths expand_paths returns
+        cls.temp_dir = os.path.realpath(tempfile.mkdtemp())
+        cls._base_len = len(cls.temp_dir) + 1
         cls._create_project_structure()
 
+        # The project tree is fixed once created, so walk it once and share the results
+        cls._all_expanded = tuple(expand_paths([cls.temp_dir]))
+        cls._src_expanded = tuple(expand_paths([os.path.join(cls.temp_dir, "src")]))
+        cls._all_parts = [tuple(p[cls._base_len :].split(os.sep)) for p in cls._all_expanded]
+
     @classmethod
     def teardown_class(cls):
         """Cleanup test structure"""
@@ -60,9 +89,6 @@ class TestFolderContent:
             ".venv/lib",  # Should be excluded
         ]
 
-        for dir_path in dirs_to_create:
-            os.makedirs(os.path.join(base_dir, dir_path), exist_ok=True)
-
         # Create files
         files_to_create = {
             # Source files (should be included)
@@ -311,21 +337,33 @@ echo "Deployment complete!"
             ".DS_Store": "Mac OS metadata",
             "Thumbs.db": "Windows thumbnail cache",
             # Large files (might be excluded by size)
-            "large_data.json": '{"data": "' + "x" * 100000 + '"}',  # Large JSON
+            # Large JSON, written as byte chunks so the 100KB payload is never built as one str
+            "large_data.json": [b'{"data": "', b"x" * 65536, b"x" * (100000 - 65536), b'"}'],
             # Binary files (should be excluded by extension)
             "image.png": b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06\x00\x00\x00\x1f\x15\xc4\x89",
         }
 
+        # Group files by parent directory so each directory is created exactly once
+        files_by_dir = {dir_path: [] for dir_path in dirs_to_create}
         for file_path, content in files_to_create.items():
-            full_path = os.path.join(base_dir, file_path)
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
-
-            if isinstance(content, bytes):
-                with open(full_path, "wb") as f:
-                    f.write(content)
-            else:
-                with open(full_path, "w", encoding="utf-8") as f:
-                    f.write(content)
+            dir_path, filename = os.path.split(file_path)
+            files_by_dir.setdefault(dir_path, []).append((filename, content))
+
+        for dir_path, files in files_by_dir.items():
+            full_dir = os.path.join(base_dir, dir_path)
+            os.makedirs(full_dir, exist_ok=True)
+
+            for filename, content in files:
+                full_path = os.path.join(full_dir, filename)
+                if isinstance(content, bytes):
+                    with open(full_path, "wb") as f:
+                        f.write(content)
+                elif isinstance(content, list):
+                    with open(full_path, "wb") as f:
+                        f.writelines(content)
+                else:
+                    with open(full_path, "w", encoding="utf-8") as f:
+                        f.write(content)
 
     def test_project_structure_created(self):
         """Test that project structure was created correctly"""
@@ -340,68 +378,74 @@ echo "Deployment complete!"
             "scripts",
         ]
 
+        # Scan each parent once; DirEntry.is_dir() uses the dirent type, so no stat per directory
+        subdirs_by_parent = {}
         for dir_path in expected_dirs:
-            full_path = os.path.join(self.temp_dir, dir_path)
-            assert os.path.isdir(full_path), f"Directory {dir_path} was not created"
+            parent, name = os.path.split(dir_path)
+            if parent not in subdirs_by_parent:
+                with os.scandir(os.path.join(self.temp_dir, parent)) as it:
+                    subdirs_by_parent[parent] = {entry.name for entry in it if entry.is_dir(follow_symlinks=False)}
+            assert name in subdirs_by_parent[parent], f"Directory {dir_path} was not created"
 
         print(f"Project structure created in: {self.temp_dir}")
 
-    def test_path_expansion_basic(self):
+    def test_path_expansion_basic(self, pytestconfig):
         """Test basic directory path expansion"""
-        src_dir = os.path.join(self.temp_dir, "src")
-        expanded = expand_paths([src_dir])
+        expanded = self._src_expanded
 
-        print(f"Expanded {len(expanded)} files from src/:")
-        for path in sorted(expanded):
-            rel_path = os.path.relpath(path, self.temp_dir)
-            print(f"  {rel_path}")
+        print(f"Expanded {len(expanded)} files from src/")
+        if pytestconfig.getoption("verbose") > 0:
+            for path in sorted(expanded):
+                rel_path = path[self._base_len :]
+                print(f"  {rel_path}")
 
         # Should find TypeScript and Python files
-        tsx_files = [p for p in expanded if p.endswith(".tsx")]
-        ts_files = [p for p in expanded if p.endswith(".ts")]
-        py_files = [p for p in expanded if p.endswith(".py")]
-
-        assert len(tsx_files) >= 2, "Should find TSX component files"
-        assert len(ts_files) >= 1, "Should find TypeScript files"
-        assert len(py_files) >= 1, "Should find Python files"
+        tsx_count = ts_count = py_count = 0
+        for path in expanded:
+            if path.endswith(".tsx"):
+                tsx_count += 1
+            elif path.endswith(".ts"):
+                ts_count += 1
+            elif path.endswith(".py"):
+                py_count += 1
+
+        assert tsx_count >= 2, "Should find TSX component files"
+        assert ts_count >= 1, "Should find TypeScript files"
+        assert py_count >= 1, "Should find Python files"
 
     def test_excluded_directory_filtering(self):
         """Test that excluded directories are filtered out"""
-        config = Config()
-        excluded_dirs = config.EXCLUDED_DIRS
-
-        print(f"Excluded directories: {excluded_dirs}")
+        print(f"Excluded directories: {sorted(_EXCLUDED_DIRS)}")
 
         # Expand entire project
-        all_expanded = expand_paths([self.temp_dir])
+        all_expanded = self._all_expanded
 
         # Check that no files from excluded directories are included
-        for path in all_expanded:
-            rel_path = os.path.relpath(path, self.temp_dir)
-            path_parts = rel_path.split(os.sep)
+        for path_parts in self._all_parts:
+            found = _EXCLUDED_DIRS.intersection(path_parts)
+            assert not found, f"Found file in excluded directory {found}: {os.path.join(*path_parts)}"
 
-            for excluded_dir in excluded_dirs:
-                assert excluded_dir not in path_parts, f"Found file in excluded directory {excluded_dir}: {rel_path}"
+        # Everything expand_paths returned must also come out of a walk that never enters excluded subtrees
+        pruned = {path for path, _ in _iter_files(self.temp_dir, _EXCLUDED_DIRS)}
+        assert set(all_expanded) <= pruned, f"Not reachable without excluded dirs: {set(all_expanded) - pruned}"
 
         print(f"✓ All {len(all_expanded)} files passed exclusion filtering")
 
     def test_file_extension_filtering(self):
         """Test that file extensions are properly filtered"""
-        config = Config()
-        allowed_extensions = config.ALLOWED_FILE_EXTENSIONS
-
-        print(f"Allowed extensions: {allowed_extensions}")
+        print(f"Allowed extensions: {sorted(_ALLOWED_EXT)}")
 
         # Expand entire project
-        all_expanded = expand_paths([self.temp_dir])
+        all_expanded = self._all_expanded
 
-        # Check that all files have allowed extensions
+        # Check that all files have allowed extensions, collecting them in the same pass
+        extensions_found = set()
         for path in all_expanded:
-            ext = Path(path).suffix
-            assert ext in allowed_extensions, f"File {path} has disallowed extension {ext}"
+            ext = os.path.splitext(path)[1]
+            assert ext in _ALLOWED_EXT, f"File {path} has disallowed extension {ext}"
+            extensions_found.add(ext)
 
         # Check specific file types are included
-        extensions_found = set(Path(p).suffix for p in all_expanded)
         print(f"Extensions found: {sorted(extensions_found)}")
 
         # Should find common development file extensions
@@ -412,21 +456,23 @@ echo "Deployment complete!"
 
     def test_file_reading_modes(self):
         """Test different file reading modes on folders"""
-        src_dir = os.path.join(self.temp_dir, "src")
-        expanded = expand_paths([src_dir])
+        expanded = list(self._src_expanded)
+
+        # The three modes are independent I/O-bound passes, so run them concurrently
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            embedded_content, summary_content, reference_content = executor.map(
+                lambda mode: read_files(expanded, mode=mode), ("embedded", "summary", "reference")
+            )
 
         # Test embedded mode
-        embedded_content = read_files(expanded, mode="embedded")
         assert len(embedded_content) > 0
         print(f"Embedded mode: {len(embedded_content)} files")
 
         # Test summary mode
-        summary_content = read_files(expanded, mode="summary")
         assert len(summary_content) > 0
         print(f"Summary mode: {len(summary_content)} files")
 
         # Test reference mode
-        reference_content = read_files(expanded, mode="reference")
         assert len(reference_content) > 0
         print(f"Reference mode: {len(reference_content)} files")
 
@@ -439,12 +485,15 @@ echo "Deployment complete!"
         many_files_dir = os.path.join(self.temp_dir, "many_files")
         os.makedirs(many_files_dir, exist_ok=True)
 
-        # Create 50 small files
-        for i in range(50):
+        # Create 50 small files, overlapping the writes
+        def write_file(i):
             file_path = os.path.join(many_files_dir, f"file_{i:02d}.txt")
             with open(file_path, "w") as f:
                 f.write(f"This is test file number {i}\nContent line 2\nContent line 3\n")
 
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(write_file, range(50)))
+
         # Test expansion
         expanded = expand_paths([many_files_dir])
         assert len(expanded) == 50
@@ -458,19 +507,18 @@ echo "Deployment complete!"
 
     def test_nested_folder_traversal(self):
         """Test deep nested folder traversal"""
-        # Get all files in project
-        all_files = expand_paths([self.temp_dir])
-
-        # Group by depth
+        # Group all files in project by depth
         depth_counts = {}
-        for path in all_files:
-            rel_path = os.path.relpath(path, self.temp_dir)
-            depth = len(rel_path.split(os.sep))
+        for path_parts in self._all_parts:
+            depth = len(path_parts)
             depth_counts[depth] = depth_counts.get(depth, 0) + 1
 
-        print("Files by directory depth:")
-        for depth in sorted(depth_counts.keys()):
-            print(f"  Depth {depth}: {depth_counts[depth]} files")
+        # Buffer the report and emit it with a single write
+        buf = io.StringIO()
+        buf.write("Files by directory depth:\n")
+        for depth in sorted(depth_counts):
+            buf.write(f"  Depth {depth}: {depth_counts[depth]} files\n")
+        sys.stdout.write(buf.getvalue())
 
         # Should have files at multiple depths
         assert len(depth_counts) >= 2, "Should have files at different depths"
@@ -516,13 +564,10 @@ echo "Deployment complete!"
         except Exception as e:
             pytest.skip(f"SAGE folder analysis failed: {e}")
 
-    def test_folder_size_estimation(self):
+    def test_folder_size_estimation(self, pytestconfig):
         """Test estimation of folder content size"""
-        from utils.tokens import estimate_tokens_for_files
-
         # Read src folder
-        src_dir = os.path.join(self.temp_dir, "src")
-        expanded = expand_paths([src_dir])
+        expanded = list(self._src_expanded)
         content = read_files(expanded, mode="embedded")
 
         # Estimate tokens
@@ -532,11 +577,15 @@ echo "Deployment complete!"
         assert total_tokens > 0
         assert total_tokens < 100000  # Should be reasonable size
 
-        # Break down by file
+        # Break down by file; only worth the per-file estimator calls when the output is shown
+        if pytestconfig.getoption("verbose") <= 0:
+            return
+        buf = io.StringIO()
         for path, file_content in content.items():
             tokens = estimate_tokens_for_files({path: file_content})
-            rel_path = os.path.relpath(path, self.temp_dir)
-            print(f"  {rel_path}: {tokens:,} tokens")
+            rel_path = path[self._base_len :]
+            buf.write(f"  {rel_path}: {tokens:,} tokens\n")
+        sys.stdout.write(buf.getvalue())
 
     def test_folder_deduplication(self):
         """Test that duplicate files in folders are handled correctly"""
@@ -616,33 +665,15 @@ if __name__ == "__main__":
         print(f"Test project structure created in: {test_class.temp_dir}")
 
         # List all files created
-        all_files = []
-        for root, dirs, files in os.walk(test_class.temp_dir):
-            for file in files:
-                path = os.path.join(root, file)
-                rel_path = os.path.relpath(path, test_class.temp_dir)
-                size = os.path.getsize(path)
-                all_files.append((rel_path, size))
+        all_files = [(path[test_class._base_len :], size) for path, size in _iter_files(test_class.temp_dir)]
 
         print(f"Created {len(all_files)} files:")
         for rel_path, size in sorted(all_files):
             print(f"  {rel_path} ({size:,} bytes)")
         sys.exit(0)
 
-    if args.test:
-        # Run specific test
-        test_class = TestFolderContent()
-        test_class.setup_class()
-
-        test_method = getattr(test_class, f"test_{args.test}", None)
-        if test_method:
-            if asyncio.iscoroutinefunction(test_method):
-                asyncio.run(test_method())
-            else:
-                test_method()
-            print(f"✓ Test {args.test} completed")
-        else:
-            print(f"❌ Test {args.test} not found")
-    else:
-        # Run all tests with pytest
-        pytest.main([__file__, "-v" if args.verbose else ""])
+    # Run a specific test (fixtures need pytest) or all of them
+    argv = [f"{__file__}::TestFolderContent::test_{args.test}" if args.test else __file__]
+    if args.verbose:
+        argv.append("-v")
+    pytest.main(argv)
@@ -0,0 +1,178 @@
+"""
+Shared fixtures for provider tests
+
+The ``cassette`` fixture records the HTTP traffic of the provider SDKs (every httpx2 request,
+which covers the OpenAI, Anthropic, DeepSeek and Custom providers) to one JSON cassette per test
+under tests/providers/cassettes/. Live runs always hit the real API and re-record the cassette;
+set PROVIDER_PLAYBACK=1 to answer requests from the recordings instead (no API keys or local
+servers needed). Error responses, connection errors and requests the test cancelled (recorded as
+timeouts) are kept too, so fallback paths replay as they ran. Tests without a cassette are skipped
+at their first request. A request missing from a cassette raises MissingRecording, an ordinary
+Exception that the SDKs and tests handle like any other provider failure; with
+PROVIDER_PLAYBACK=strict the miss also fails the test.
+
+Request headers (API keys) are never stored, credentials are dropped from URLs and only the
+content type is kept of the response headers, so cassettes can be reviewed and committed.
+The Gemini SDK talks gRPC rather than HTTP, so its tests are not recorded and always run live.
+
+Tests marked ``requires_env("NAME")`` are skipped at collection time when NAME is unset,
+unless playback is on (pass ``replayable=False`` for tests that cannot run from cassettes).
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sys
+from collections import defaultdict, deque
+from pathlib import Path
+
+import httpx2
+import pytest
+
+# Make the project packages (providers, utils, ...) importable once, before the test modules are collected
+PROJECT_ROOT = str(Path(__file__).parent.parent.parent)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+CASSETTE_DIR = Path(__file__).parent / "cassettes"
+
+# Query parameters that carry credentials, dropped from recorded URLs
+SECRET_PARAMS = ("key", "api_key")
+
+
+def _playback() -> bool:
+    return os.getenv("PROVIDER_PLAYBACK") in ("1", "strict")
+
+
+def _strict_playback() -> bool:
+    return os.getenv("PROVIDER_PLAYBACK") == "strict"
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "requires_env(name, replayable=True): skip unless the variable is set (or cassettes are replayed)"
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    """Skip tests whose provider credentials are missing before any fixture or event loop is set up"""
+    playback = _playback()
+    skips = {}  # one lookup and one shared skip mark per variable
+    for item in items:
+        for marker in item.iter_markers("requires_env"):
+            name = marker.args[0]
+            if name not in skips:
+                skips[name] = None if os.getenv(name) else pytest.mark.skip(reason=f"{name} not set")
+            if skips[name] and not (playback and marker.kwargs.get("replayable", True)):
+                item.add_marker(skips[name])
+
+
+def _public_url(url: httpx2.URL) -> httpx2.URL:
+    for param in SECRET_PARAMS:
+        url = url.copy_remove_param(param)
+    return url
+
+
+def _decode_body(content: bytes):
+    """JSON bodies are stored parsed (readable diffs), anything else (event streams) as text"""
+    text = content.decode("utf-8")
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def _match_key(method: str, url: httpx2.URL, body) -> str:
+    """Requests match on method, path, query and canonical body; the host is left out so a Custom
+    endpoint recorded on one machine replays against another's CUSTOM_API_URL"""
+    canonical = json.dumps(body, sort_keys=True, ensure_ascii=False)
+    digest = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+    return f"{method} {url.raw_path.decode('ascii')} {digest}"
+
+
+class MissingRecording(Exception):
+    """Raised in playback for a request the cassette has no response for"""
+
+
+class Cassette:
+    """HTTP interactions recorded for one test, replayed in order per matching request"""
+
+    def __init__(self, path: Path, playback: bool, strict: bool = False):
+        self.path = path
+        self.playback = playback
+        self.strict = strict
+        self.recorded = path.exists()
+        self.replies = defaultdict(deque)
+        for interaction in json.loads(path.read_text(encoding="utf-8")) if self.recorded else []:
+            request = interaction["request"]
+            key = _match_key(request["method"], httpx2.URL(request["url"]), request["body"])
+            self.replies[key].append(interaction["response"])
+        self.interactions = []
+        self.missing = []
+
+    async def handle(self, send, request: httpx2.Request) -> httpx2.Response:
+        """Serve one SDK request from the recordings (playback) or the network (recording it)"""
+        url = _public_url(request.url)
+        body = _decode_body(await request.aread())
+        key = _match_key(request.method, url, body)
+
+        if self.playback:
+            if not self.recorded:
+                pytest.skip(f"No cassette recorded for {self.path.stem}")
+            replies = self.replies.get(key)
+            if not replies:
+                self.missing.append(f"{request.method} {url.path}")
+                raise MissingRecording(f"No recorded response for {request.method} {url.path} in {self.path.name}")
+            # Repeated identical requests get the recorded responses in order; the last one is reused
+            reply = replies.popleft() if len(replies) > 1 else replies[0]
+        else:
+            try:
+                response = await send(request)
+                content = await response.aread()
+            except httpx2.TransportError as e:
+                reply = {"error": type(e).__name__, "message": str(e)}
+                self._record(request.method, url, body, reply)
+                raise
+            except asyncio.CancelledError:
+                # The caller gave up waiting (a test timing out a stalled model); replay that as a timeout
+                self._record(request.method, url, body, {"error": "ReadTimeout", "message": "Cancelled by the caller"})
+                raise
+            reply = {
+                "status": response.status_code,
+                "headers": {"content-type": response.headers.get("content-type", "")},
+                "body": _decode_body(content),
+            }
+            self._record(request.method, url, body, reply)
+
+        if "error" in reply:
+            raise getattr(httpx2, reply["error"], httpx2.TransportError)(reply["message"], request=request)
+        body = reply["body"] if isinstance(reply["body"], str) else json.dumps(reply["body"])
+        return httpx2.Response(reply["status"], headers=reply["headers"], content=body.encode("utf-8"), request=request)
+
+    def _record(self, method: str, url: httpx2.URL, body, reply: dict):
+        self.interactions.append({"request": {"method": method, "url": str(url), "body": body}, "response": reply})
+
+    def save(self):
+        """Replace the cassette with this live run's traffic"""
+        if self.interactions:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_text(json.dumps(self.interactions, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+
+
+@pytest.fixture
+def cassette(request, monkeypatch):
+    """Per-test cassette routing every httpx2 request through record/replay, saved at teardown"""
+    path = CASSETTE_DIR / request.module.__name__.rpartition(".")[2] / f"{request.node.name}.json"
+    recording = Cassette(path, playback=_playback(), strict=_strict_playback())
+    send = httpx2.AsyncHTTPTransport.handle_async_request
+
+    async def handle_async_request(transport, http_request):
+        return await recording.handle(lambda req: send(transport, req), http_request)
+
+    monkeypatch.setattr(httpx2.AsyncHTTPTransport, "handle_async_request", handle_async_request)
+    yield recording
+    recording.save()
+    if recording.strict and recording.missing:
+        missing = ", ".join(dict.fromkeys(recording.missing))  # the SDKs retry, so a miss repeats
+        pytest.fail(f"Requests missing from {path.name} (PROVIDER_PLAYBACK=strict): {missing}")
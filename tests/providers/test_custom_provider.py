@@ -5,106 +5,178 @@ Tests Custom provider functionality including Ollama integration and local model
 """
 
 import asyncio
-import json
-import os
-import time
+import logging
+import sys
+from functools import lru_cache
 from pathlib import Path
+from time import perf_counter
 
 import pytest
 import requests
+from openai import AuthenticationError
 
-# Add project root to path
-import sys
-
-sys.path.append(str(Path(__file__).parent.parent.parent))
+if __name__ == "__main__":
+    # Run as a script, the provider conftest has not put the project root on sys.path yet
+    sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
 from providers.custom import CustomProvider
 from utils.models import ModelRestrictionService
 
+# Skip reasons stay static; the underlying error is only formatted when debug logging is on
+logger = logging.getLogger(__name__)
+
+LOCAL_MODEL = "llama3.2"
+# Models tried in order until one answers, most common first
+LOCAL_MODELS = ("llama3.2", "llama2", "qwen2.5", "phi3", "gemma2")
+OLLAMA_TAGS_URL = "http://localhost:11434/api/tags"
+
+# Keep-alive connections shared by every Ollama probe in the module
+_SESSION = requests.Session()
+
+
+@lru_cache(maxsize=1)
+def _ollama_up() -> bool:
+    """Whether Ollama answers on localhost:11434, probed once per session"""
+    try:
+        return _SESSION.get(OLLAMA_TAGS_URL, timeout=5).status_code == 200
+    except requests.RequestException:
+        return False
+
+
+TEMPERATURE_MESSAGES = [{"role": "user", "content": "Write a creative name for a pet robot. Just one name."}]
+
+# (name, messages, temperature, check on the response)
+COMPLETION_CASES = [
+    (
+        "basic text completion",
+        [{"role": "user", "content": "Say 'Hello from Custom provider test' and nothing else."}],
+        0.1,
+        lambda response: "Hello from Custom provider test" in response,
+    ),
+    (
+        "conversation memory",
+        [
+            {"role": "user", "content": "My favorite number is 77."},
+            {"role": "assistant", "content": "I'll remember that your favorite number is 77."},
+            {"role": "user", "content": "What did I say my favorite number was?"},
+        ],
+        0.1,
+        lambda response: "77" in response,
+    ),
+    (
+        "system prompt",
+        [
+            {"role": "system", "content": "You are a helpful math teacher. Always explain your work."},
+            {"role": "user", "content": "What is 15 + 25?"},
+        ],
+        0.1,
+        # Should explain due to system prompt
+        lambda response: "40" in response and len(response) > 10,
+    ),
+    # Both temperatures should give a relatively short response
+    ("low temperature", TEMPERATURE_MESSAGES, 0.1, lambda response: len(response.split()) <= 10),
+    ("high temperature", TEMPERATURE_MESSAGES, 0.9, lambda response: len(response.split()) <= 10),
+]
+
+
+@pytest.fixture(scope="module")
+def provider():
+    """One CustomProvider (and so one HTTP connection pool) shared by the module's tests"""
+    return CustomProvider()
+
 
 class TestCustomProvider:
     """Test Custom/Ollama provider functionality"""
 
-    def setup_method(self):
-        """Setup test environment"""
-        self.provider = CustomProvider()
+    @pytest.fixture(autouse=True)
+    def _setup(self, cassette, provider):
+        """Setup test environment; provider HTTP traffic is recorded/replayed through the cassette"""
+        self.cassette = cassette
+        self.provider = provider
 
-    def test_provider_initialization(self):
+    def test_provider_initialization(self, provider):
         """Test provider can be initialized"""
-        assert self.provider is not None
-        assert hasattr(self.provider, "complete")
+        assert isinstance(provider, CustomProvider)
+        assert hasattr(provider, "complete")
 
     def test_ollama_connectivity(self):
         """Test if Ollama is running and accessible"""
-        try:
-            response = requests.get("http://localhost:11434/api/tags", timeout=5)
-            return response.status_code == 200
-        except:
-            return False
-
-    @pytest.mark.asyncio
-    async def test_basic_text_completion(self):
-        """Test basic text completion with local models"""
-        # Skip if no custom API URL configured
-        if not os.getenv("CUSTOM_API_URL"):
-            pytest.skip("CUSTOM_API_URL not set")
-
-        # Check if Ollama is running
-        if not self.test_ollama_connectivity():
+        return _ollama_up()
+
+    @pytest.mark.requires_env("CUSTOM_API_URL")
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_batch_completions(self):
+        """Test text, conversation, system prompt and temperature completions with a local model concurrently"""
+        if not (self.cassette.playback or _ollama_up()):
             pytest.skip("Ollama not running on localhost:11434")
 
-        messages = [{"role": "user", "content": "Say 'Hello from Custom provider test' and nothing else."}]
+        # Bound in-flight requests; Ollama queues anything beyond its parallelism anyway
+        semaphore = asyncio.Semaphore(10)
 
-        try:
-            response = await self.provider.complete(messages=messages, model="llama3.2", temperature=0.1)
-            assert response
-            assert "Hello from Custom provider test" in response
-        except Exception as e:
-            pytest.skip(f"API call failed: {e}")
+        async def complete(messages, temperature):
+            async with semaphore:
+                return await self.provider.complete(messages=messages, model=LOCAL_MODEL, temperature=temperature)
+
+        results = await asyncio.gather(
+            *(complete(messages, temperature) for _, messages, temperature, _ in COMPLETION_CASES),
+            return_exceptions=True,
+        )
+
+        # pytest outcomes (the skip for a test without a cassette) are BaseExceptions, not API errors; let them through
+        for response in results:
+            if isinstance(response, BaseException) and not isinstance(response, Exception):
+                raise response
+
+        # A rejected key is a setup problem, not a provider regression
+        if any(isinstance(response, AuthenticationError) for response in results):
+            pytest.skip("CUSTOM_API_KEY rejected")
+
+        # Check every case before failing, so one run reports all the broken ones
+        failures = []
+        for (name, *_, check), response in zip(COMPLETION_CASES, results):
+            if isinstance(response, Exception):
+                failures.append(f"{name}: {type(response).__name__}: {response}")
+            elif not (response and check(response)):
+                failures.append(f"{name}: unexpected response {response!r}")
+
+        assert not failures, "\n".join(failures)
 
-    @pytest.mark.asyncio
+    @pytest.mark.requires_env("CUSTOM_API_URL")
+    @pytest.mark.asyncio(loop_scope="session")
     async def test_local_model_inference(self):
         """Test inference with local Ollama models"""
-        if not os.getenv("CUSTOM_API_URL"):
-            pytest.skip("CUSTOM_API_URL not set")
-
-        if not self.test_ollama_connectivity():
+        if not (self.cassette.playback or _ollama_up()):
             pytest.skip("Ollama not running")
 
         messages = [{"role": "user", "content": "What is 6 * 7? Answer with just the number."}]
 
-        # Try different common models
-        models_to_try = ["llama3.2", "llama2", "qwen2.5", "phi3", "gemma2"]
-
-        for model in models_to_try:
+        # Try common models one at a time in a fixed order, so a recording replays the same requests
+        for model in LOCAL_MODELS:
             try:
                 response = await self.provider.complete(messages=messages, model=model, temperature=0.1)
-                assert response
-                assert "42" in response
-                print(f"✓ Local model {model} working")
-                return  # Success with at least one model
             except Exception as e:
-                print(f"⚠ Model {model} failed: {e}")
+                logger.debug("Model %s failed: %s", model, e)
                 continue
+            if response and "42" in response:
+                return  # Success with at least one model
+            logger.debug("Model %s answered %r", model, response)
 
         pytest.skip("No local models available in Ollama")
 
+    @pytest.mark.requires_env("CUSTOM_API_URL", replayable=False)
     def test_list_available_models(self):
         """Test listing available models from Ollama"""
-        if not os.getenv("CUSTOM_API_URL"):
-            pytest.skip("CUSTOM_API_URL not set")
-
-        if not self.test_ollama_connectivity():
+        if not _ollama_up():
             pytest.skip("Ollama not running")
 
         try:
-            response = requests.get("http://localhost:11434/api/tags", timeout=10)
+            response = _SESSION.get(OLLAMA_TAGS_URL, timeout=10)
             assert response.status_code == 200
 
             data = response.json()
             models = data.get("models", [])
 
-            print(f"Available Ollama models: {[m['name'] for m in models]}")
+            logger.debug("Available Ollama models: %s", [m["name"] for m in models])
 
             # Should have at least one model if Ollama is set up
             if len(models) == 0:
@@ -112,123 +184,31 @@ class TestCustomProvider:
 
             assert len(models) > 0
 
-        except Exception as e:
-            pytest.skip(f"Failed to list models: {e}")
-
-    @pytest.mark.asyncio
-    async def test_different_temperature_settings(self):
-        """Test different temperature settings with local models"""
-        if not os.getenv("CUSTOM_API_URL"):
-            pytest.skip("CUSTOM_API_URL not set")
-
-        if not self.test_ollama_connectivity():
-            pytest.skip("Ollama not running")
-
-        messages = [{"role": "user", "content": "Write a creative name for a pet robot. Just one name."}]
+        except Exception:
+            logger.debug("Failed to list models", exc_info=True)
+            pytest.skip("Failed to list models")
 
-        try:
-            # Test deterministic (low temperature)
-            response_low = await self.provider.complete(messages=messages, model="llama3.2", temperature=0.1)
-
-            # Test creative (high temperature)
-            response_high = await self.provider.complete(messages=messages, model="llama3.2", temperature=0.9)
-
-            assert response_low
-            assert response_high
-
-            # Both should be relatively short
-            assert len(response_low.split()) <= 10
-            assert len(response_high.split()) <= 10
-
-            print(f"Low temp: {response_low}")
-            print(f"High temp: {response_high}")
+    def test_model_restrictions(self, monkeypatch):
+        """Test that model restrictions work correctly for custom models"""
+        # Set restrictions; monkeypatch restores the environment at teardown
+        monkeypatch.setenv("DISABLED_MODEL_PATTERNS", "llama2,phi")
+        monkeypatch.setenv("BLOCKED_MODELS", "dangerous-model")
 
-        except Exception as e:
-            pytest.skip(f"Temperature test failed: {e}")
+        # Create new restriction service with updated env
+        restriction_service = ModelRestrictionService()
 
-    @pytest.mark.asyncio
-    async def test_conversation_memory(self):
-        """Test multi-turn conversation handling"""
-        if not os.getenv("CUSTOM_API_URL"):
-            pytest.skip("CUSTOM_API_URL not set")
+        # Test disabled patterns
+        assert not restriction_service.is_model_allowed("llama2")
+        assert not restriction_service.is_model_allowed("phi3")
 
-        if not self.test_ollama_connectivity():
-            pytest.skip("Ollama not running")
+        # Test blocked models
+        assert not restriction_service.is_model_allowed("dangerous-model")
 
-        messages = [
-            {"role": "user", "content": "My favorite number is 77."},
-            {"role": "assistant", "content": "I'll remember that your favorite number is 77."},
-            {"role": "user", "content": "What did I say my favorite number was?"},
-        ]
-
-        try:
-            response = await self.provider.complete(messages=messages, model="llama3.2", temperature=0.1)
-            assert response
-            assert "77" in response
-        except Exception as e:
-            pytest.skip(f"Conversation test failed: {e}")
-
-    @pytest.mark.asyncio
-    async def test_system_prompt_support(self):
-        """Test system prompt handling with local models"""
-        if not os.getenv("CUSTOM_API_URL"):
-            pytest.skip("CUSTOM_API_URL not set")
-
-        if not self.test_ollama_connectivity():
-            pytest.skip("Ollama not running")
-
-        messages = [
-            {"role": "system", "content": "You are a helpful math teacher. Always explain your work."},
-            {"role": "user", "content": "What is 15 + 25?"},
-        ]
+        # Test allowed models
+        assert restriction_service.is_model_allowed("llama3.2")
+        assert restriction_service.is_model_allowed("qwen2.5")
 
-        try:
-            response = await self.provider.complete(messages=messages, model="llama3.2", temperature=0.1)
-            assert response
-            assert "40" in response
-            # Should explain due to system prompt
-            assert len(response) > 10
-        except Exception as e:
-            pytest.skip(f"System prompt test failed: {e}")
-
-    @pytest.mark.asyncio
-    async def test_model_restrictions(self):
-        """Test that model restrictions work correctly for custom models"""
-        # Test with restricted environment
-        old_patterns = os.environ.get("DISABLED_MODEL_PATTERNS", "")
-        old_blocked = os.environ.get("BLOCKED_MODELS", "")
-
-        try:
-            # Set restrictions
-            os.environ["DISABLED_MODEL_PATTERNS"] = "llama2,phi"
-            os.environ["BLOCKED_MODELS"] = "dangerous-model"
-
-            # Create new restriction service with updated env
-            restriction_service = ModelRestrictionService()
-
-            # Test disabled patterns
-            assert not restriction_service.is_model_allowed("llama2")
-            assert not restriction_service.is_model_allowed("phi3")
-
-            # Test blocked models
-            assert not restriction_service.is_model_allowed("dangerous-model")
-
-            # Test allowed models
-            assert restriction_service.is_model_allowed("llama3.2")
-            assert restriction_service.is_model_allowed("qwen2.5")
-
-        finally:
-            # Restore environment
-            if old_patterns:
-                os.environ["DISABLED_MODEL_PATTERNS"] = old_patterns
-            else:
-                os.environ.pop("DISABLED_MODEL_PATTERNS", None)
-            if old_blocked:
-                os.environ["BLOCKED_MODELS"] = old_blocked
-            else:
-                os.environ.pop("BLOCKED_MODELS", None)
-
-    @pytest.mark.asyncio
+    @pytest.mark.asyncio(loop_scope="session")
     async def test_custom_api_endpoint(self):
         """Test custom API endpoint configuration"""
         # Test with different endpoints
@@ -237,102 +217,68 @@ class TestCustomProvider:
             "http://127.0.0.1:11434",  # Alternative localhost
         ]
 
-        for endpoint in endpoints_to_test:
-            try:
-                # Set custom endpoint
-                old_url = os.environ.get("CUSTOM_API_URL", "")
-                os.environ["CUSTOM_API_URL"] = endpoint
-
-                # Test connectivity
-                response = requests.get(f"{endpoint}/api/tags", timeout=5)
-                if response.status_code == 200:
-                    print(f"✓ Endpoint {endpoint} accessible")
-                    return  # Found working endpoint
-
-            except Exception as e:
-                print(f"⚠ Endpoint {endpoint} failed: {e}")
-                continue
-            finally:
-                # Restore original URL
-                if old_url:
-                    os.environ["CUSTOM_API_URL"] = old_url
-
+        # Probe the endpoints concurrently off the event loop (requests is blocking)
+        results = await asyncio.gather(
+            *(asyncio.to_thread(_SESSION.get, f"{endpoint}/api/tags", timeout=5) for endpoint in endpoints_to_test),
+            return_exceptions=True,
+        )
+
+        accessible = False
+        for endpoint, response in zip(endpoints_to_test, results):
+            if isinstance(response, Exception):
+                logger.debug("Endpoint %s failed: %s", endpoint, response)
+            elif response.status_code == 200:
+                accessible = True
+
+        if accessible:
+            return  # Found working endpoint
         pytest.skip("No custom endpoints accessible")
 
-    @pytest.mark.asyncio
+    @pytest.mark.requires_env("CUSTOM_API_URL", replayable=False)
+    @pytest.mark.asyncio(loop_scope="session")
     async def test_performance_timing(self):
         """Test response times for local models"""
-        if not os.getenv("CUSTOM_API_URL"):
-            pytest.skip("CUSTOM_API_URL not set")
-
-        if not self.test_ollama_connectivity():
+        if self.cassette.playback:
+            pytest.skip("Timing a replayed response measures nothing")
+        if not _ollama_up():
             pytest.skip("Ollama not running")
 
         messages = [{"role": "user", "content": "Count from 1 to 5."}]
 
         try:
-            start_time = time.time()
+            start_time = perf_counter()
             response = await self.provider.complete(messages=messages, model="llama3.2", temperature=0.1)
-            end_time = time.time()
-
-            assert response
-            duration = end_time - start_time
-
-            print(f"Local model response time: {duration:.2f}s")
+            duration = perf_counter() - start_time
+        except Exception:
+            logger.debug("Performance test failed", exc_info=True)
+            pytest.skip("Performance test failed")
 
-            # Local models should respond reasonably quickly
-            # Allow up to 30 seconds for smaller models
-            assert duration < 30.0
+        assert response
+        logger.debug("Local model response time: %.2fs", duration)
 
-        except Exception as e:
-            pytest.skip(f"Performance test failed: {e}")
+        # Local models should respond reasonably quickly
+        # Allow up to 10 seconds for smaller models
+        assert duration < 10.0
 
-    @pytest.mark.asyncio
+    @pytest.mark.requires_env("CUSTOM_API_URL")
+    @pytest.mark.asyncio(loop_scope="session")
     async def test_error_handling(self):
         """Test error handling for invalid requests"""
-        if not os.getenv("CUSTOM_API_URL"):
-            pytest.skip("CUSTOM_API_URL not set")
-
         messages = [{"role": "user", "content": "Test message"}]
 
-        # Test invalid model
+        # Test invalid model; the error response is recorded like any other
         with pytest.raises(Exception):
             await self.provider.complete(messages=messages, model="nonexistent-local-model-12345", temperature=0.5)
 
 
 if __name__ == "__main__":
-    # Run individual tests
-    import argparse
-
-    parser = argparse.ArgumentParser(description="Test Custom Provider")
-    parser.add_argument("--test", help="Specific test to run")
-    parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
-    parser.add_argument("--check-ollama", action="store_true", help="Check Ollama connectivity only")
-    args = parser.parse_args()
-
-    if args.check_ollama:
+    if "--check-ollama" in sys.argv[1:]:
         # Quick connectivity check
-        test_class = TestCustomProvider()
-        if test_class.test_ollama_connectivity():
+        if _ollama_up():
             print("✓ Ollama is running and accessible")
         else:
             print("❌ Ollama is not accessible")
         sys.exit(0)
 
-    if args.test:
-        # Run specific test
-        test_class = TestCustomProvider()
-        test_class.setup_method()
-
-        test_method = getattr(test_class, f"test_{args.test}", None)
-        if test_method:
-            if asyncio.iscoroutinefunction(test_method):
-                asyncio.run(test_method())
-            else:
-                test_method()
-            print(f"✓ Test {args.test} completed")
-        else:
-            print(f"❌ Test {args.test} not found")
-    else:
-        # Run all tests with pytest
-        pytest.main([__file__, "-v" if args.verbose else ""])
+    # Run this file under pytest; extra arguments (-k, -v, ...) are passed through
+    sys.exit(pytest.main([__file__, *sys.argv[1:]]))
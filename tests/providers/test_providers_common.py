@@ -0,0 +1,58 @@
+"""
+Common Provider Testing Script
+Tests behaviour shared by every API provider, run once per provider
+"""
+
+import pytest
+from google.api_core.exceptions import GoogleAPIError
+from openai import OpenAIError
+
+from providers.deepseek import DeepSeekProvider
+from providers.gemini import GeminiProvider
+from providers.openai import OpenAIProvider
+
+# What the providers raise when a call cannot be made (Gemini raises ValueError for blocked responses)
+PROVIDER_ERRORS = (ValueError, OpenAIError, GoogleAPIError)
+
+# (provider class, model, phrase the model is asked to echo)
+BASIC_COMPLETION_CASES = [
+    pytest.param(
+        DeepSeekProvider,
+        "deepseek-chat",
+        "Hello from DeepSeek test",
+        id="deepseek",
+        marks=pytest.mark.requires_env("DEEPSEEK_API_KEY"),
+    ),
+    pytest.param(
+        GeminiProvider,
+        "gemini-1.5-flash",
+        "Hello from Gemini provider test",
+        id="gemini",
+        # The Gemini SDK talks gRPC, which the cassettes cannot record
+        marks=pytest.mark.requires_env("GEMINI_API_KEY", replayable=False),
+    ),
+    pytest.param(
+        OpenAIProvider,
+        "gpt-4o-mini",
+        "Hello from OpenAI provider test",
+        id="openai",
+        marks=pytest.mark.requires_env("OPENAI_API_KEY"),
+    ),
+]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.parametrize("provider_cls,model,phrase", BASIC_COMPLETION_CASES)
+async def test_basic_text_completion(cassette, provider_cls, model, phrase):
+    """Test basic text completion with each provider's everyday model"""
+    provider = provider_cls()
+    messages = [{"role": "user", "content": f"Say '{phrase}' and nothing else."}]
+
+    try:
+        response = await provider.complete(messages=messages, model=model, temperature=0.1)
+    except PROVIDER_ERRORS as e:
+        pytest.skip(f"API call failed: {e}")
+
+    assert response
+    assert isinstance(response, str)
+    assert phrase in response
@@ -11,6 +11,7 @@ import os
 import subprocess
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Add project root to path
@@ -47,21 +48,25 @@ class TestRunner:
         print(f"{title}")
         print(f"{'-'*40}")
 
-    def run_pytest(self, test_path, category, description):
-        """Run pytest on a specific test path"""
-        self.print_subheader(f"Running {description}")
-
+    def start_pytest(self, test_path):
+        """Run pytest on a specific test path in a subprocess and return the completed process"""
         cmd = [sys.executable, "-m", "pytest", str(test_path), "-v" if self.verbose else "", "--tb=short"]
         cmd = [arg for arg in cmd if arg]  # Remove empty strings
 
+        return subprocess.run(
+            cmd,
+            capture_output=True,
+            text=True,
+            timeout=300,  # 5 minute timeout per test suite
+            cwd=self.project_root,
+        )
+
+    def run_pytest(self, test_path, category, description, future=None):
+        """Run pytest on a specific test path (or report a run already started in `future`)"""
+        self.print_subheader(f"Running {description}")
+
         try:
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=300,  # 5 minute timeout per test suite
-                cwd=self.project_root,
-            )
+            result = future.result() if future else self.start_pytest(test_path)
 
             # Parse pytest output
             output_lines = result.stdout.split("\n")
@@ -233,13 +238,19 @@ class TestRunner:
             (self.test_dir / "providers" / "test_anthropic_provider.py", "Anthropic Provider"),
             (self.test_dir / "providers" / "test_openrouter_provider.py", "OpenRouter Provider"),
             (self.test_dir / "providers" / "test_custom_provider.py", "Custom/Ollama Provider"),
+            (self.test_dir / "providers" / "test_providers_common.py", "Common Provider Behaviour"),
         ]
 
-        for test_file, description in provider_tests:
-            if test_file.exists():
-                self.run_pytest(test_file, "providers", description)
-            else:
-                print(f"⚠ Provider test not found: {test_file}")
+        # The provider files are independent and mostly wait on I/O, so each runs in its own pytest process
+        # concurrently; results are still reported in the order above
+        existing = [test_file for test_file, _ in provider_tests if test_file.exists()]
+        with ThreadPoolExecutor(max_workers=max(len(existing), 1)) as pool:
+            futures = {test_file: pool.submit(self.start_pytest, test_file) for test_file in existing}
+            for test_file, description in provider_tests:
+                if test_file in futures:
+                    self.run_pytest(test_file, "providers", description, futures[test_file])
+                else:
+                    print(f"⚠ Provider test not found: {test_file}")
 
     def run_file_type_tests(self):
         """Run file type tests"""
@@ -5,6 +5,7 @@ Supports directory expansion, deduplication, and multiple handling modes
 
 import os
 import logging
+import stat
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Union
 
@@ -49,6 +50,15 @@ def expand_paths(paths: List[str]) -> List[str]:
     return expanded
 
 
+def _stat_file(path: Path) -> Optional[os.stat_result]:
+    """Stat path once, returning None unless it is an existing regular file"""
+    try:
+        stat_info = path.stat()
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return stat_info if stat.S_ISREG(stat_info.st_mode) else None
+
+
 def read_files(
     file_paths: List[str], mode: str = "embedded", max_tokens: Optional[int] = None
 ) -> Union[Dict[str, str], Dict[str, dict]]:
@@ -92,14 +102,14 @@ def read_files_embedded(file_paths: List[str], max_tokens: Optional[int] = None)
     file_info = []
     for path in file_paths:
         abs_path = Path(path).resolve()
-        if abs_path.exists() and abs_path.is_file():
-            mtime = abs_path.stat().st_mtime
-            file_info.append((str(abs_path), mtime))
+        stat_info = _stat_file(abs_path)
+        if stat_info is not None:
+            file_info.append((str(abs_path), stat_info))
 
     # Sort by modification time (newest first)
-    file_info.sort(key=lambda x: x[1], reverse=True)
+    file_info.sort(key=lambda x: x[1].st_mtime, reverse=True)
 
-    for path, _ in file_info:
+    for path, stat_info in file_info:
         try:
             abs_path = Path(path)
 
@@ -108,8 +118,8 @@ def read_files_embedded(file_paths: List[str], max_tokens: Optional[int] = None)
                 logger.warning(f"Unsafe path skipped: {abs_path}")
                 continue
 
-            # Size check
-            size = abs_path.stat().st_size
+            # Size check - reuses the stat from above, so oversized files are never opened
+            size = stat_info.st_size
             if size > config.MAX_FILE_SIZE:
                 logger.warning(f"File too large ({size} bytes): {abs_path}")
                 contents[str(abs_path)] = f"[File too large: {size:,} bytes]"
@@ -158,11 +168,10 @@ def read_files_summary(file_paths: List[str]) -> Dict[str, dict]:
         try:
             abs_path = Path(path).resolve()
 
-            if not abs_path.exists() or not abs_path.is_file():
+            # Get file info (one stat covers the existence and type checks)
+            stat_info = _stat_file(abs_path)
+            if stat_info is None:
                 continue
-
-            # Get file info
-            stat_info = abs_path.stat()
             size = stat_info.st_size
 
             # Read first few lines for summary
@@ -214,13 +223,14 @@ def read_files_reference(file_paths: List[str]) -> Dict[str, dict]:
     for path in file_paths:
         try:
             abs_path = Path(path).resolve()
+            stat_info = _stat_file(abs_path)
 
-            if abs_path.exists() and abs_path.is_file():
+            if stat_info is not None:
                 ref_id = f"ref_{hash(str(abs_path)) % 10000:04d}"
                 references[str(abs_path)] = {
                     "reference_id": ref_id,
                     "stored": True,
-                    "size": abs_path.stat().st_size,
+                    "size": stat_info.st_size,
                     "type": abs_path.suffix,
                 }
             else:
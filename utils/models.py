@@ -182,6 +182,13 @@ class ModelRestrictionService:
         # Global blocks
         self.blocked_models = set(m.lower().strip() for m in restrictions["blocked_models"] if m.strip())
         self.disabled_patterns = [p.lower().strip() for p in restrictions["disabled_patterns"] if p.strip()]
+        # One compiled alternation instead of a regex search per pattern on every lookup;
+        # word boundaries avoid partial matches like "mini" in "gemini"
+        self._disabled_re = (
+            re.compile(r"\b(?:" + "|".join(map(re.escape, self.disabled_patterns)) + r")\b")
+            if self.disabled_patterns
+            else None
+        )
 
         if self.blocked_models:
             logger.info(f"Blocked models: {sorted(self.blocked_models)}")
@@ -198,11 +205,10 @@ class ModelRestrictionService:
             return False
 
         # Check disabled patterns
-        for pattern in self.disabled_patterns:
-            # Use word boundary regex to avoid partial matches like "mini" in "gemini"
-            if re.search(r"\b" + re.escape(pattern) + r"\b", model_lower):
-                logger.debug(f"Model {model_name} matches disabled pattern: {pattern}")
-                return False
+        match = self._disabled_re.search(model_lower) if self._disabled_re else None
+        if match:
+            logger.debug(f"Model {model_name} matches disabled pattern: {match.group(0)}")
+            return False
 
         # Check provider-specific restrictions
         if model_lower.startswith(("gpt", "o1", "o3", "text-")):